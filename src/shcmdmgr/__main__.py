@@ -20,14 +20,17 @@
 
 import os
 import sys
+import json
+import math
+import heapq
 import subprocess
 import enum
 from os.path import join, exists
 from string import Template
 
-from shcmdmgr import util, config, filemanip, structure, complete, args, parser, cio
+from shcmdmgr import util, config, filemanip, structure, complete, args, parser, cio, dependency, search, export, cache, frecency, process
 from shcmdmgr.structure import Command, Project
-from shcmdmgr.config import SCRIPT_PATH, GLOBAL_COMMANDS_FILE_LOCATION
+from shcmdmgr.config import SCRIPT_PATH, GLOBAL_COMMANDS_FILE_LOCATION, GLOBAL_STAMPS_FILE_LOCATION
 from shcmdmgr.args import Argument, CommandArgument, ArgumentGroup
 from shcmdmgr.parser import Parser
 
@@ -39,12 +42,15 @@ WORKING_DIRECTORY = os.getcwd()
 COMPLETE = None
 PRINT_HELP = False
 PROJECT_ROOT_VAR = 'project_root'
+FIND_FIELDS = ['alias', 'command', 'description', 'creation_time', 'scope', 'priority', 'frecency']
+DEFAULT_FIND_FIELDS = ['alias', 'command', 'description']
 DEFAULT_COMMAND_LOAD_DEJA_VU = False
 FORM = None
 CONF = None
 LOGGER = None
 PARSER = None
 PROJECT = None
+SCORES = None
 PROJECT_ALIASES = None
 ALIASES = None
 ARGUMENT_GROUP = None
@@ -72,6 +78,8 @@ def main():
     LOGGER.debug('Script folder: %s', FORM.quote(SCRIPT_PATH))
     LOGGER.debug('Working directory: %s', FORM.quote(WORKING_DIRECTORY))
     LOGGER.debug('Arguments: %s', str(sys.argv))
+    global SCORES
+    SCORES = frecency.Scores(CONF['frecency_half_life_days']) # read only when a ranking is needed
     global PROJECT
     PROJECT = Project.retrieve_project_if_present(WORKING_DIRECTORY, FORM)
     if PROJECT: os.environ[PROJECT_ROOT_VAR] = PROJECT.directory # expose variable to subprocesses
@@ -102,12 +110,22 @@ def main_command():
         LOGGER.warning('No command given')
         return USER_ERROR
 
-    if not PARSER.may_have([ArgumentGroup.PROJECT_COMMANDS, ArgumentGroup.CUSTOM_COMMANDS, ArgumentGroup.CMD_COMMANDS]):
-        LOGGER.warning('The argument/command %s was not found', FORM.quote(current_command))
-        LOGGER.info('run "cmd --help" if you are having trouble')
+    try:
+        if not PARSER.may_have([ArgumentGroup.PROJECT_COMMANDS, ArgumentGroup.CUSTOM_COMMANDS, ArgumentGroup.CMD_COMMANDS]):
+            LOGGER.warning('The argument/command %s was not found', FORM.quote(current_command))
+            LOGGER.info('run "cmd --help" if you are having trouble')
+            return USER_ERROR
+    except process.InvalidLimit as ex:
+        LOGGER.warning('The command was not run, it has an %s', str(ex))
         return USER_ERROR
 
-    return SUCCESSFULL_EXECUTION
+    return exit_code(PARSER.result)
+
+def exit_code(result) -> int:
+    # the result of the command (e.g. of the executed alias) becomes the exit status
+    if not isinstance(result, int): return SUCCESSFULL_EXECUTION
+    if result < 0: return 128 - result # killed by a signal, the same as in shells
+    return result
 
 # == Formatting ==================================================================
 
@@ -123,7 +141,7 @@ def print_general_help():
         ArgumentGroup.CMD_SHOWN_COMMANDS,
         ArgumentGroup.OPTIONAL_ARGUMENTS,
     ]
-    FORM.print_str(ArgumentGroup.to_str(main_groups), end='')
+    FORM.print_str(ArgumentGroup.to_str(main_groups, alias_scores()), end='')
     # additional_str = ''
     # FORM.print_str(additional_str) #todo print info including special options (such as --complete)
     return SUCCESSFULL_EXECUTION
@@ -188,6 +206,7 @@ def cmd_save():
     commands_db = structure.load_commands(commands_file_location)
     commands_db.append(Command(command_to_save, description, alias))
     filemanip.save_json_file(commands_db, commands_file_location)
+    refresh_shell_export()
     return SUCCESSFULL_EXECUTION
 
 def get_context_command_file_location() -> str:
@@ -196,13 +215,19 @@ def get_context_command_file_location() -> str:
     return None
 
 def cmd_find():
+    options = {'json': False, 'limit': None, 'fields': DEFAULT_FIND_FIELDS}
+    other_args = [
+        Argument(lambda: options.update(json=True), '--json', '-j', 'print results as newline-delimited JSON instead of the interactive search'),
+        Argument(lambda: options.update(limit=PARSER.shift()), '--limit', '-l', 'stop after this many results (with --json)'),
+        Argument(lambda: options.update(fields=PARSER.shift()), '--fields', None, 'comma separated fields to print (with --json): ' + ','.join(FIND_FIELDS)),
+    ]
+    PARSER.load_all([ArgumentGroup('find arguments', other_args)])
     if COMPLETE: return complete_nothing()
+    if options['json']: return find_json(options)
     max_cmd_count = 4
     max_cmd_count_slack = 2
-    commands_db = structure.load_commands(GLOBAL_COMMANDS_FILE_LOCATION)
-    if PROJECT:
-        commands_db += PROJECT.commands
-    selected_commands = []
+    table = load_search_table()
+    selected_rows = []
     try:
         while True:
             FORM.print_str(40 * '=')
@@ -211,43 +236,125 @@ def cmd_find():
                 query = ' '.join(arguments)
                 arguments = []
             else:
-                query = input_str('query $ ')
+                query = FORM.input_str('query $ ')
             try:
                 idx = int(query)
-                if idx not in range(1, len(selected_commands)+1):
+                if idx not in range(1, len(selected_rows)+1):
                     FORM.print_str('invalid index')
                     continue
-                selected_commands[idx-1].execute(PARSER.get_rest())
+                table.commands[selected_rows[idx-1]].execute(PARSER.get_rest())
                 break
             except ValueError as _:
                 pass
-            index = 1
-            results = []
-            for command in commands_db:
-                result = command.find(query)
-                if result is not None:
-                    (priority, formatted_text) = result
-                    results.append((priority, formatted_text, command))
+            try:
+                compiled_query = search.Query(query)
+            except ValueError as ex:
+                FORM.print_str('invalid query: ' + str(ex))
+                continue
+            results = compiled_query.search(table)
             total_results_count = len(results)
             if total_results_count == 0:
                 FORM.print_str('No results found')
-            results = sorted(results, reverse=True) # by priority
-            selected_commands = []
             cmd_showing_count = max_cmd_count
             if total_results_count <= cmd_showing_count + max_cmd_count_slack:
                 cmd_showing_count += max_cmd_count_slack
-            for result in results[:cmd_showing_count]:
-                (_, text, command) = result
-                selected_commands.append(command)
+            selected_rows = [row for (_, row) in rank_results(results, table, cmd_showing_count)]
+            for (index, row) in enumerate(selected_rows, 1):
                 FORM.print_str('--- ' + str(index) + ' ' + (30 * '-'))
-                FORM.print_str(text, end='')
-                index = index+1
+                for (name, column) in [('cmd', 'command'), ('des', 'description')]:
+                    text = table.columns[column][row]
+                    FORM.print_str(name + ': ' + FORM.highlight(text, compiled_query.spans(table, row, column)))
             if total_results_count > cmd_showing_count:
                 FORM.print_str('\nand ' + str(total_results_count-cmd_showing_count) + ' other commands')
     except EOFError as _:
         FORM.print_str()
     return SUCCESSFULL_EXECUTION
 
+def load_search_table() -> search.Table:
+    scoped_commands = [('global', command) for command in structure.load_commands(GLOBAL_COMMANDS_FILE_LOCATION)]
+    if PROJECT:
+        scoped_commands += [('project', command) for command in PROJECT.commands]
+    return search.Table(scoped_commands, SCORES, CONF['time_format'])
+
+def rank_results(results, table, limit=None):
+    frecency_column = table.columns['frecency']
+    def key(result): # by score boosted by frecency, then frecency, then catalogue order
+        (score, row) = result
+        return (score * (1 + math.log1p(frecency_column[row])), frecency_column[row], -row)
+    if limit is None:
+        return sorted(results, key=key, reverse=True)
+    return heapq.nlargest(max(limit, 0), results, key=key) # no need to sort what is not shown
+
+def find_json(options):
+    fields = options['fields']
+    if isinstance(fields, str): fields = [field for field in fields.split(',') if field]
+    unknown_fields = [field for field in fields if field not in FIND_FIELDS]
+    if unknown_fields or not fields:
+        LOGGER.warning('Invalid fields %s, choose from %s', FORM.quote(','.join(unknown_fields)), ','.join(FIND_FIELDS))
+        return INVALID_ARGUMENT
+    limit = options['limit']
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            LOGGER.warning('The limit %s is not a number', FORM.quote(limit))
+            return INVALID_ARGUMENT
+    query = ' '.join(PARSER.get_rest())
+    try:
+        compiled_query = search.Query(query)
+    except ValueError as ex:
+        LOGGER.warning('Invalid query %s: %s', FORM.quote(query), str(ex))
+        return INVALID_ARGUMENT
+    table = load_search_table()
+    try:
+        for (priority, row) in rank_results(compiled_query.search(table), table, limit):
+            values = {
+                'alias': table.columns['alias'][row] or None,
+                'command': table.columns['command'][row],
+                'description': table.columns['description'][row] or None,
+                'creation_time': table.columns['creation_time'][row],
+                'scope': table.columns['scope'][row],
+                'priority': priority,
+                'frecency': round(table.columns['frecency'][row], 4),
+            }
+            print(json.dumps({field: values[field] for field in fields}, ensure_ascii=False), flush=True)
+    except BrokenPipeError:
+        sys.stderr.close() # the reader has enough, e.g. "| head -1"
+    return SUCCESSFULL_EXECUTION
+
+def cmd_cached():
+    options = {'refresh': False}
+    other_args = [
+        Argument(lambda: options.update(refresh=True), '--refresh', '-r', 'run the command even if its output is cached'),
+    ]
+    PARSER.load_all([ArgumentGroup('cached arguments', other_args)])
+    if COMPLETE: return complete_nothing()
+    alias = PARSER.shift()
+    command = find_alias(alias)
+    if not command:
+        LOGGER.warning('The alias %s was not found', FORM.quote(alias))
+        return USER_ERROR
+    if command.cache_ttl is None:
+        LOGGER.warning('The command %s has no "cache_ttl", running it without cache', FORM.quote(alias))
+        return command.execute(PARSER.get_rest())
+    frecency.record(command)
+    output_cache = cache.OutputCache(CONF['cache_max_bytes'], CONF['cache_environment'])
+    return output_cache.run(command, PARSER.get_rest(), options['refresh'])
+
+def alias_scores() -> {str: float}:
+    commands_db = structure.load_commands(GLOBAL_COMMANDS_FILE_LOCATION)
+    if PROJECT:
+        commands_db += PROJECT.commands
+    return SCORES.of_aliases(commands_db)
+
+def find_alias(alias) -> Command:
+    # project aliases take precedence in the same way as in the argument parsing
+    commands_db = (PROJECT.commands if PROJECT else []) + structure.load_commands(GLOBAL_COMMANDS_FILE_LOCATION)
+    for command in commands_db:
+        if alias and command.alias == alias and isinstance(command.command, str):
+            return command
+    return None
+
 def cmd_edit():
     if COMPLETE: return complete_nothing()
     editor = 'vim'
@@ -256,8 +363,13 @@ def cmd_edit():
     except KeyError:
         pass
     subprocess.run([editor, get_context_command_file_location()], check=True)
+    refresh_shell_export()
     return SUCCESSFULL_EXECUTION
 
+def refresh_shell_export():
+    project_directory = PROJECT.directory if CONF['scope'] == 'project' and PROJECT else None
+    export.refresh(project_directory)
+
 def cmd_complete():
     global COMPLETE
     last_arg = sys.argv[-1]
@@ -267,6 +379,7 @@ def cmd_complete():
     COMPLETE = complete.get_complete(last_arg)
     LOGGER.setLevel(config.QUIET_LEVEL) # fix when set after main() call
     main_res = main()
+    COMPLETE.ranking = alias_scores()
     for word in COMPLETE.words:
         print(word, end=' ')
     print()
@@ -282,6 +395,16 @@ def cmd_completion():
         raise Exception('unsuported shell {}, choose bash or zsh'.format(FORM.quote(shell)))
     return SUCCESSFULL_EXECUTION
 
+def cmd_export_shell():
+    shell = PARSER.shift()
+    PARSER.expect_nothing()
+    if COMPLETE: return complete_nothing()
+    if shell not in export.SHELLS:
+        raise Exception('unsuported shell {}, choose bash or zsh'.format(FORM.quote(shell)))
+    export_file_location = export.export(shell, PROJECT.directory if PROJECT else None)
+    FORM.print_str('source {}'.format(export_file_location))
+    return SUCCESSFULL_EXECUTION
+
 def load_aliases(): # todo simplify
     commands_db = structure.load_commands(GLOBAL_COMMANDS_FILE_LOCATION)
     global ALIASES
@@ -289,7 +412,8 @@ def load_aliases(): # todo simplify
     for command in commands_db:
         if command.alias:
             ALIASES[command.alias] = Command(command.execute, command.description)
-    return [CommandArgument(cmd) for cmd in commands_db if cmd.alias]
+    scheduler = dependency.Scheduler(commands_db, GLOBAL_STAMPS_FILE_LOCATION, WORKING_DIRECTORY)
+    return [CommandArgument(cmd, scheduler) for cmd in commands_db if cmd.alias]
 
 def load_project_aliases(): # todo push into the parser
     global PROJECT_ALIASES
@@ -298,7 +422,8 @@ def load_project_aliases(): # todo push into the parser
         for command in PROJECT.commands:
             if command.alias:
                 PROJECT_ALIASES[command.alias] = Command(command.execute, command.description)
-        return [CommandArgument(cmd) for cmd in PROJECT.commands if cmd.alias]
+        scheduler = dependency.Scheduler(PROJECT.commands, PROJECT.stamp_file, PROJECT.directory)
+        return [CommandArgument(cmd, scheduler) for cmd in PROJECT.commands if cmd.alias]
     return None
 
 def set_function(property_name, value):
@@ -312,12 +437,14 @@ def create_set_function(property_name, value):
 def fixed_args():
     res = {}
     res['SAVE'] = ('--save', '-s', cmd_save, 'Saves command which is passed as further arguments')
-    res['FIND'] = ('--find', '-f', cmd_find, 'Opens an interactive search for saved commands')
+    res['FIND'] = ('--find', '-f', cmd_find, 'Opens an interactive search for saved commands, or prints them as JSON with --json')
+    res['CACHED'] = ('--cached', '-c', cmd_cached, 'Runs the aliased command or replays its output saved within its "cache_ttl"')
     res['EDIT'] = ('--edit', '-e', cmd_edit, 'Edit the command databse in text editor')
     res['VERSION'] = ('--version', '-V', cmd_version, 'Prints out version information')
     res['HELP'] = ('--help', '-h', cmd_help, 'Request detailed information about flags or commands')
     res['COMPLETE'] = ('--complete', None, cmd_complete, 'Returns list of words which are supplied to the completion shell command')
     res['COMPLETION'] = ('--completion', None, cmd_completion, 'Return shell command to be added to the .rc file to allow completion')
+    res['EXPORT_SHELL'] = ('--export-shell', None, cmd_export_shell, 'Return shell command to be added to the .rc file to run aliases without starting python')
     res['QUIET'] = ('--quiet', '-q', create_set_function('logging_level', config.QUIET_LEVEL), 'No output will be shown')
     res['VERBOSE'] = ('--verbose', '-v', create_set_function('logging_level', config.VERBOSE_LEVEL), 'More detailed output information')
     res['DEBUG'] = ('--debug', '-d', create_set_function('logging_level', config.DEBUG_LEVEL), 'Very detailed messages of script\'s inner workings')
@@ -331,8 +458,8 @@ def fixed_argument_groups():
     res['CUSTOM_COMMANDS'] = ArgumentGroup('custom commands', None, load_aliases, 'You may add new custom commands via "cmd --save if the command is given alias, it will show up here')
     global ARGUMENT_GROUP
     a = ARGUMENT_GROUP
-    res['CMD_COMMANDS'] = ArgumentGroup('management commands', [a['SAVE'], a['FIND'], a['EDIT'], a['VERSION'], a['HELP'], a['COMPLETE'], a['COMPLETION']])
-    res['CMD_SHOWN_COMMANDS'] = ArgumentGroup('management commands', [a['SAVE'], a['FIND'], a['EDIT'], a['VERSION'], a['HELP']])
+    res['CMD_COMMANDS'] = ArgumentGroup('management commands', [a['SAVE'], a['FIND'], a['CACHED'], a['EDIT'], a['VERSION'], a['HELP'], a['COMPLETE'], a['COMPLETION'], a['EXPORT_SHELL']])
+    res['CMD_SHOWN_COMMANDS'] = ArgumentGroup('management commands', [a['SAVE'], a['FIND'], a['CACHED'], a['EDIT'], a['VERSION'], a['HELP']])
     res['OUTPUT_ARGUMENTS'] = ArgumentGroup('', [a['QUIET'], a['VERBOSE'], a['DEBUG']])
     res['OPTIONAL_ARGUMENTS'] = ArgumentGroup('optional a', [a['QUIET'], a['VERBOSE'], a['DEBUG'], a['PROJECT_SCOPE'], a['GLOBAL_SCOPE']])
     return res
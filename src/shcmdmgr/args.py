@@ -29,8 +29,11 @@ class Argument:
         return total
 
 class CommandArgument(Argument):
-    def __init__(self, command: Command):
-        fun = lambda: (command.execute(PARSER.get_rest()))
+    def __init__(self, command: Command, scheduler=None):
+        if scheduler and command.is_incremental:
+            fun = lambda: (scheduler.run(command, PARSER.get_rest()))
+        else:
+            fun = lambda: (command.execute(PARSER.get_rest()))
         super().__init__(fun, command.alias, None, command.description)
 
 def set_scope(scope):
@@ -56,7 +59,8 @@ class ArgumentGroup:
         return None
 
     @staticmethod
-    def to_str(groups: []):
+    def to_str(groups: [], ranking: {str: float} = None):
+        ranking = ranking or {}
         res = ""
         for group in groups:
             if res != '': res += '\n'
@@ -65,7 +69,7 @@ class ArgumentGroup:
                 args = group.arg_fun()
             if args and len(args) != 0:
                 res += group.group_name + ":\n"
-                for argument in args:
+                for argument in sorted(args, key=lambda arg: -ranking.get(arg.arg_name, 0)):
                     res += argument.to_str()
             elif group.if_empty:
                 res += group.group_name + ":\n"
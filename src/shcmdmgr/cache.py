@@ -0,0 +1,115 @@
+''' Replaying captured output of read-only commands, see the cache_ttl field of a command '''
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import subprocess
+from os.path import join
+
+from shcmdmgr import config, process
+from shcmdmgr.config import DATA_PATH
+
+CACHE_PATH = join(DATA_PATH, 'cache')
+CHUNK_SIZE = 1 << 16
+
+LOGGER = config.get_logger()
+
+
+class OutputCache:
+    # one file per entry: a JSON header line followed by stdout and stderr bytes
+    # the file modification time is the last use, the least recently used are evicted first
+    def __init__(self, max_bytes: int, environment: [str], directory=CACHE_PATH):
+        self.max_bytes = max_bytes
+        self.environment = environment # names of variables which are part of the key
+        self.directory = directory
+
+    def key(self, argv, cwd) -> str:
+        environment = {name: os.environ.get(name) for name in self.environment}
+        identity = json.dumps([argv, cwd, environment], sort_keys=True)
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def load(self, key, ttl):
+        path = join(self.directory, key)
+        try:
+            with open(path, 'rb') as entry_file:
+                header = json.loads(entry_file.readline())
+                if time.time() - header['created'] > ttl:
+                    return None
+                stdout = entry_file.read(header['stdout'])
+                stderr = entry_file.read(header['stderr'])
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        os.utime(path) # mark as recently used
+        return (header['returncode'], stdout, stderr)
+
+    def store(self, key, returncode, stdout, stderr):
+        header = json.dumps({'created': time.time(), 'returncode': returncode, 'stdout': len(stdout), 'stderr': len(stderr)})
+        content = header.encode('utf-8') + b'\n' + stdout + stderr
+        if len(content) > self.max_bytes:
+            LOGGER.debug('output of %d bytes is over the cache budget, not stored', len(content))
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        (handle, temporary_path) = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(handle, 'wb') as entry_file:
+            entry_file.write(content)
+        os.replace(temporary_path, join(self.directory, key)) # readers never see a partial entry
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('.'): continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes: break
+            os.remove(path)
+            total -= size
+
+    def run(self, command, args=None, refresh=False) -> int:
+        limits = process.check_limits(command.limits)
+        argv = command.argv(args)
+        key = self.key(argv, os.getcwd())
+        if not refresh:
+            cached = self.load(key, command.cache_ttl)
+            if cached:
+                LOGGER.verbose('replaying cached output of: ' + command.command)
+                (returncode, stdout, stderr) = cached
+                sys.stdout.buffer.write(stdout)
+                sys.stdout.flush()
+                sys.stderr.buffer.write(stderr)
+                sys.stderr.flush()
+                return returncode
+        LOGGER.verbose('running command: ' + command.command)
+        (returncode, stdout, stderr) = run_captured(argv, limits)
+        if returncode < 0 or returncode == process.TIMEOUT_EXIT_CODE:
+            # the output of a killed run is partial, while a non-zero exit is an answer (e.g. grep found nothing)
+            LOGGER.debug('output of a killed command is not stored')
+            return returncode
+        self.store(key, returncode, stdout, stderr)
+        return returncode
+
+
+def run_captured(argv, limits=None) -> (int, bytes, bytes):
+    # the output is shown while the command runs and captured at the same time
+    supervised = process.start(argv, limits, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    captured = {}
+    def tee(name, source, target):
+        chunks = []
+        for chunk in iter(lambda: source.read1(CHUNK_SIZE), b''):
+            chunks.append(chunk)
+            target.write(chunk)
+            target.flush()
+        captured[name] = b''.join(chunks)
+    threads = [
+        threading.Thread(target=tee, args=('stdout', supervised.stdout, sys.stdout.buffer)),
+        threading.Thread(target=tee, args=('stderr', supervised.stderr, sys.stderr.buffer)),
+    ]
+    for thread in threads: thread.start()
+    returncode = process.supervise(supervised, limits)
+    for thread in threads: thread.join()
+    return (returncode, captured['stdout'], captured['stderr'])
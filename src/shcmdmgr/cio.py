@@ -1,5 +1,3 @@
-import re
-import readline
 
 class Formatter:
     def __init__(self, config, logger):
@@ -14,29 +12,23 @@ class Formatter:
         if level >= logger.level:
             print(text, end=end)
 
-    def search_and_format(self, pattern: str, text: str) -> (int, str):
-        if text is None:
-            return (0, "")
-        priority = 0
-        occurences = list(re.finditer(pattern, text, re.I))
+    def highlight(self, text: str, spans: [(int, int)]) -> str:
         color_format = '\033[{0}m'
         color_str = color_format.format(31) # red color
         reset_str = color_format.format(0) # default color
+        parts = []
         last_match = 0
-        formatted_text = ''
-        for match in occurences:
-            start, end = match.span()
-            formatted_text += text[last_match: start]
-            formatted_text += color_str
-            formatted_text += text[start: end]
-            formatted_text += reset_str
+        for start, end in sorted(spans):
+            start = max(start, last_match) # overlapping matches of different terms
+            if end <= start: continue
+            parts += [text[last_match: start], color_str, text[start: end], reset_str]
             last_match = end
-        formatted_text += text[last_match:]
-        priority += len(occurences)
-        return (priority, formatted_text)
+        parts.append(text[last_match:])
+        return ''.join(parts)
 
     # https://stackoverflow.com/questions/8505163/is-it-possible-to-prefill-a-input-in-python-3s-command-line-interface
     def input_str(self, prompt, prefill='', level=None):
+        import readline # imported lazily, non-interactive commands do not need it
         if not level: level = self.config.TEXT_LEVEL
         if level < logger.level: prompt = ''
         def hook():
@@ -8,6 +8,7 @@ class Complete:
     def __init__(self, last_arg: str):
         self.last_arg = last_arg
         self.words = []
+        self.ranking = {} # word -> frecency score, higher is offered first
 
     @property
     def words(self):
@@ -15,7 +16,7 @@ class Complete:
         for word in self.__words:
             if word.startswith(self.last_arg) and (len(self.last_arg) != 0 or word[0] != '-'):
                 res_words.append(word)
-        return res_words
+        return sorted(res_words, key=lambda word: -self.ranking.get(word, 0)) # stable, keeps the order of ties
 
     @words.setter
     def words(self, words):
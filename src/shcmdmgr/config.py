@@ -9,6 +9,7 @@ DATA_PATH = join(SCRIPT_PATH, 'data')
 GLOBAL_CONFIG_FILE = join(DATA_PATH, '_config.json')
 LOCAL_CONFIG_FILE = join(DATA_PATH, 'config_local.json')
 GLOBAL_COMMANDS_FILE_LOCATION = join(DATA_PATH, 'commands.json')
+GLOBAL_STAMPS_FILE_LOCATION = join(DATA_PATH, 'stamps.json')
 
 VERBOSE_LEVEL = 15
 TEXT_LEVEL = 30
@@ -25,10 +26,11 @@ def get_logger():
             self._log(VERBOSE_LEVEL, message, args, **kws)
     logging.Logger.verbose = verbose
     LOGGER = logging.getLogger()
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
-    LOGGER.addHandler(handler)
+    if not LOGGER.handlers: # modules call this on import, the handler is added only once
+        handler = logging.StreamHandler()
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        handler.setFormatter(formatter)
+        LOGGER.addHandler(handler)
     return LOGGER
 
 def get_conf():
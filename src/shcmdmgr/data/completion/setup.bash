@@ -15,4 +15,6 @@ function _shcmdmgr_completion_func {
     for reply_word in "${reply[@]}"; do COMPREPLY+=("$reply_word "); done
 }
 
-complete -o nospace -F _shcmdmgr_completion_func "$1"
+# keep the frecency order of the offered words where bash supports it (4.4+)
+complete -o nosort -o nospace -F _shcmdmgr_completion_func "$1" 2>/dev/null || \
+    complete -o nospace -F _shcmdmgr_completion_func "$1"
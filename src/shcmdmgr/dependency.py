@@ -0,0 +1,157 @@
+''' Running saved commands together with their dependencies, skipping those which are up to date '''
+import os
+import glob
+import hashlib
+import subprocess
+from os.path import join, exists, isabs
+from string import Template
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from shcmdmgr import config, filemanip, process
+
+LOGGER = config.get_logger()
+
+HASH_BLOCK_SIZE = 1 << 16
+
+
+def file_hash(path) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as checked_file:
+        for block in iter(lambda: checked_file.read(HASH_BLOCK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class Scheduler:
+    # runs an alias after its 'depends' in a worker pool, state is kept in the stamp file
+    def __init__(self, commands, stamp_file, base_directory, workers=None):
+        self.commands = {command.alias: command for command in commands if command.alias}
+        self.stamp_file = stamp_file
+        self.base_directory = base_directory
+        self.workers = workers or os.cpu_count() or 1
+
+    def resolve_paths(self, patterns) -> [str]:
+        paths = set()
+        for pattern in patterns or []:
+            pattern = Template(pattern).safe_substitute(os.environ)
+            if not isabs(pattern):
+                pattern = join(self.base_directory, pattern)
+            matched = glob.glob(pattern, recursive=True)
+            if not matched and not glob.has_magic(pattern):
+                matched = [pattern] # keep missing plain files so that they are noticed
+            paths.update(path for path in matched if not os.path.isdir(path))
+        return sorted(paths)
+
+    def watched_paths(self, command) -> [str]:
+        # outputs of the dependencies are inputs as well, dependencies without outputs do not force a rerun
+        patterns = list(command.inputs or [])
+        for dependency_alias in command.depends or []:
+            patterns += self.commands[dependency_alias].outputs or []
+        return self.resolve_paths(patterns)
+
+    def fingerprint(self, command, record) -> dict:
+        # mtime and size are compared first, the content is hashed only when they differ
+        old_inputs = (record or {}).get('inputs', {})
+        inputs = {}
+        for path in self.watched_paths(command):
+            if not exists(path):
+                inputs[path] = None
+                continue
+            stat = os.stat(path)
+            old = old_inputs.get(path)
+            if old and old['mtime'] == stat.st_mtime and old['size'] == stat.st_size:
+                digest = old['sha256']
+            else:
+                digest = file_hash(path)
+            inputs[path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': digest}
+        return inputs
+
+    @staticmethod
+    def same_inputs(old_inputs, new_inputs) -> bool:
+        if old_inputs.keys() != new_inputs.keys():
+            return False
+        for path, new in new_inputs.items():
+            old = old_inputs[path]
+            if new is None or old is None or old['sha256'] != new['sha256']:
+                return False
+        return True
+
+    def up_to_date(self, command, record, inputs, args) -> bool:
+        if not command.inputs or not record:
+            return False
+        if record.get('command') != command.command or record.get('arguments', []) != args:
+            return False
+        if not all(exists(path) for path in self.resolve_paths(command.outputs)):
+            return False
+        return Scheduler.same_inputs(record.get('inputs', {}), inputs)
+
+    def collect(self, target) -> {str: [str]}:
+        # returns alias -> dependency aliases for the whole graph below the target
+        graph = {}
+        visiting = []
+        def visit(command):
+            if command.alias in graph:
+                return
+            if command.alias in visiting:
+                raise Exception('dependency cycle: ' + ' -> '.join(visiting + [command.alias]))
+            visiting.append(command.alias)
+            for dependency_alias in command.depends or []:
+                if dependency_alias not in self.commands:
+                    raise Exception('command "{}" depends on unknown alias "{}"'.format(command.alias, dependency_alias))
+                visit(self.commands[dependency_alias])
+            visiting.pop()
+            graph[command.alias] = list(command.depends or [])
+        visit(target)
+        return graph
+
+    def run(self, target, args=None) -> int:
+        # dependencies run in worker threads without the terminal (stdin is /dev/null),
+        # the target runs last in the main thread, so that it may be interactive
+        args = args or []
+        graph = self.collect(target)
+        for alias in graph: # before anything runs
+            process.check_limits(self.commands[alias].limits)
+        stamps = filemanip.load_json_file(self.stamp_file)
+        state = {} # alias -> 'ran' or 'skipped'
+        failed = None
+        def finished(alias, command, inputs, command_args, return_code):
+            nonlocal failed
+            if (return_code or 0) != 0:
+                LOGGER.warning('command "%s" failed with exit code %d', alias, return_code)
+                failed = return_code
+                return
+            state[alias] = 'ran'
+            if command.inputs:
+                stamps[alias] = {'command': command.command, 'arguments': command_args, 'inputs': inputs}
+                filemanip.save_json_file(stamps, self.stamp_file)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            running = {}
+            try:
+                while failed is None and (graph or running):
+                    ready = [alias for alias, depends in graph.items() if all(dep in state for dep in depends)]
+                    for alias in ready:
+                        command = self.commands[alias]
+                        command_args = args if alias == target.alias else []
+                        record = stamps.get(alias)
+                        inputs = self.fingerprint(command, record)
+                        del graph[alias]
+                        if self.up_to_date(command, record, inputs, command_args):
+                            LOGGER.verbose('skipping up to date command: ' + alias)
+                            state[alias] = 'skipped'
+                            continue
+                        if alias == target.alias: # everything else is done, as all nodes are its dependencies
+                            finished(alias, command, inputs, command_args, command.execute(command_args))
+                            continue
+                        future = pool.submit(command.execute, command_args, subprocess.DEVNULL)
+                        running[future] = (alias, command, inputs, command_args)
+                    if not running:
+                        continue # skipped commands may have unblocked others
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished(*running.pop(future), future.result())
+            except KeyboardInterrupt:
+                for future in running: future.cancel() # those which did not start yet
+                process.terminate_all() # running commands are in their own process groups
+                raise
+            wait(running)
+        return failed or 0
@@ -0,0 +1,140 @@
+''' Generating shell functions which run saved aliases without starting python '''
+import re
+import shlex
+from os.path import join, exists, isdir
+from string import Template
+
+from shcmdmgr import config, filemanip, structure, frecency
+from shcmdmgr.config import DATA_PATH, GLOBAL_COMMANDS_FILE_LOCATION
+
+SHELLS = ['bash', 'zsh']
+EXPORTED_PROJECTS_FILE = join(DATA_PATH, 'exported_projects.json')
+
+LOGGER = config.get_logger()
+
+HEADER = '''# generated by shell-command-manager, do not edit, regenerate by: cmd --export-shell {shell}
+# {shell} functions for saved aliases, other arguments are passed to the cmd program
+
+_shcmdmgr_file={file}
+{setup}
+_shcmdmgr_find_project() {{
+    _shcmdmgr_root="$PWD"
+    while [ ! -d "$_shcmdmgr_root/.cmd" ]; do
+        if [ -z "$_shcmdmgr_root" ]; then return 1; fi
+        _shcmdmgr_root="${{_shcmdmgr_root%/*}}"
+    done
+    _shcmdmgr_root="${{_shcmdmgr_root:-/}}"
+}}
+'''
+
+# invocations are appended to the log of frecency.record by a shell builtin, without starting a process
+SHELL_SETUP = {
+    'bash': '',
+    'zsh': 'zmodload zsh/datetime\n',
+}
+RECORD = {
+    'bash': "printf '%(%s)T\\t%s\\t%s\\n' -1 \"$_shcmdmgr_catalogue\" \"$1\"",
+    'zsh': "printf '%s\\t%s\\t%s\\n' \"$EPOCHSECONDS\" \"$_shcmdmgr_catalogue\" \"$1\"",
+}
+
+DISPATCHER = '''
+cmd() {{
+    local _shcmdmgr_fn='' _shcmdmgr_catalogue=''
+    _shcmdmgr_root=''
+    if _shcmdmgr_find_project; then
+        case "$_shcmdmgr_root" in
+{projects}            *) command cmd "$@"; return;; # unknown project, its aliases are not exported
+        esac
+        if [ "$_shcmdmgr_root/.cmd/commands.json" -nt "$_shcmdmgr_file" ]; then command cmd "$@"; return; fi
+    fi
+    if [ -z "$_shcmdmgr_fn" ]; then
+        case "$1" in
+{aliases}        esac
+    fi
+    if [ -z "$_shcmdmgr_fn" ] || [ {global_file} -nt "$_shcmdmgr_file" ]; then command cmd "$@"; return; fi
+    {record} 2>/dev/null >> {log_file}
+    shift
+    (
+        if [ -n "$_shcmdmgr_root" ]; then export project_root="$_shcmdmgr_root"; fi
+        "$_shcmdmgr_fn" "$@"
+    )
+}}
+'''
+
+
+def export_file_location(shell: str) -> str:
+    return join(DATA_PATH, 'aliases.{}'.format(shell))
+
+def function_name(prefix: str, alias: str) -> str:
+    return '_shcmdmgr_{}_{}'.format(prefix, re.sub('[^A-Za-z0-9_]', '_', alias))
+
+def exportable(command, variables) -> bool:
+    # commands with dependencies need the python scheduler, those with limits the python supervisor
+    if not isinstance(command.command, str) or command.is_incremental:
+        return False
+    if any(limit is not None for limit in command.limits.values()):
+        return False
+    return shell_command(command.command, variables) is not None
+
+def shell_command(command: str, variables: {str: str}) -> str:
+    # the same argv as Command.argv builds, variables are substituted before splitting, so only those
+    # known when generating (project_root of a project) can be used, None if it cannot be expressed
+    try:
+        return ' '.join(shlex.quote(word) for word in shlex.split(Template(command).substitute(variables)))
+    except (KeyError, ValueError):
+        return None
+
+def functions_and_cases(prefix: str, commands, variables, indent: str) -> (str, str):
+    # the catalogue is recorded with the alias, the same as by frecency.command_key
+    functions = ''
+    cases = ''
+    names = set()
+    for (index, command) in enumerate(commands):
+        if not command.alias: continue
+        if not exportable(command, variables): # it must not fall through to an alias of another catalogue
+            cases += '{}{}) command cmd "$@"; return;;\n'.format(indent, shlex.quote(command.alias))
+            continue
+        name = function_name(prefix, command.alias)
+        if name in names: name += '_{}'.format(index) # aliases differing in special characters only
+        names.add(name)
+        functions += '{}() {{\n    {} "$@"\n}}\n'.format(name, shell_command(command.command, variables))
+        cases += '{}{}) _shcmdmgr_fn={} _shcmdmgr_catalogue={};;\n'.format(indent, shlex.quote(command.alias), name, shlex.quote(command.catalogue or ''))
+    return (functions, cases)
+
+def generate(shell: str, global_commands, projects) -> str:
+    res = HEADER.format(shell=shell, file=shlex.quote(export_file_location(shell)), setup=SHELL_SETUP[shell])
+    project_cases = ''
+    for (index, (directory, commands)) in enumerate(sorted(projects.items())):
+        (functions, cases) = functions_and_cases('p{}'.format(index), commands, {'project_root': directory}, 20 * ' ')
+        res += '\n' + functions
+        project_cases += '            {})\n'.format(shlex.quote(directory))
+        project_cases += '                case "$1" in\n' + cases + '                esac;;\n'
+    (functions, alias_cases) = functions_and_cases('g', global_commands, {}, 12 * ' ')
+    res += '\n' + functions
+    res += DISPATCHER.format(projects=project_cases, aliases=alias_cases, global_file=shlex.quote(GLOBAL_COMMANDS_FILE_LOCATION),
+                             record=RECORD[shell], log_file=shlex.quote(frecency.LOG_FILE))
+    return res
+
+def export(shell: str, project_directory: str = None) -> str:
+    # writes the function file of the shell including all projects exported so far
+    projects_directories = filemanip.load_json_file(EXPORTED_PROJECTS_FILE) or []
+    if project_directory and project_directory not in projects_directories:
+        projects_directories.append(project_directory)
+    projects = {}
+    for directory in projects_directories:
+        commands_file = join(directory, structure.PROJECT_SPECIFIC_SUBFOLDER, 'commands.json')
+        if isdir(directory) and exists(commands_file):
+            projects[directory] = structure.load_commands(commands_file)
+    filemanip.save_json_file(sorted(projects), EXPORTED_PROJECTS_FILE)
+    global_commands = structure.load_commands(GLOBAL_COMMANDS_FILE_LOCATION)
+    location = export_file_location(shell)
+    with open(location, 'w', encoding='utf-8') as export_file:
+        export_file.write(generate(shell, global_commands, projects))
+    return location
+
+def refresh(project_directory: str = None):
+    # regenerates only the files of shells which were exported before
+    for shell in SHELLS:
+        if exists(export_file_location(shell)):
+            LOGGER.debug('regenerating shell functions for %s', shell)
+            export(shell, project_directory)
@@ -2,7 +2,9 @@ import json
 
 def save_json_file(json_content_object, file_location):
     # fail-safe when JSON-serialization fails
-    file_string = json.dumps(json_content_object, default=lambda o: o.__dict__, ensure_ascii=False, indent=4)
+    # unset (None) and private (_) attributes are left out so that they do not clutter the file
+    serialize = lambda o: {key: value for key, value in o.__dict__.items() if value is not None and not key.startswith('_')}
+    file_string = json.dumps(json_content_object, default=serialize, ensure_ascii=False, indent=4)
     with open(file_location, 'w', encoding='utf-8') as json_file:
         json_file.write(file_string + '\n')
 
@@ -0,0 +1,112 @@
+''' Ranking of commands by how often and how recently they were run '''
+import os
+import glob
+import time
+import fcntl
+from os.path import join, exists
+
+from shcmdmgr import config, filemanip
+from shcmdmgr.config import DATA_PATH
+
+# the locations are looked up on each use, so that they may be changed (e.g. in tests)
+LOG_FILE = join(DATA_PATH, 'invocations.log')
+SCORES_FILE = join(DATA_PATH, 'frecency.json')
+FOLD_LOG_SIZE = 4096 # bytes of the log which trigger folding it into the scores
+FOLD_INTERVAL = 3600 # seconds after which the log is folded regardless of its size
+DAY = 24 * 3600
+
+LOGGER = config.get_logger()
+
+
+def command_key(command) -> str:
+    # commands of different catalogues may share an alias, or even the command
+    return '{}\t{}'.format(command.catalogue or '', command.alias or command.command)
+
+def record(command, log_file=None):
+    # a single appended line, cheap enough to be done on every execution
+    log_file = log_file or LOG_FILE
+    try:
+        with open(log_file, 'a', encoding='utf-8') as log:
+            log.write('{}\t{}\n'.format(int(time.time()), command_key(command)))
+    except OSError as ex:
+        LOGGER.debug('invocation was not recorded: %s', str(ex))
+
+def decayed(score, since, now, half_life) -> float:
+    return score * 0.5 ** ((now - since) / half_life)
+
+def maybe_fold(half_life_days, log_file=None, scores_file=None):
+    (log_file, scores_file) = (log_file or LOG_FILE, scores_file or SCORES_FILE)
+    try:
+        log_size = os.stat(log_file).st_size
+    except FileNotFoundError:
+        return
+    scores_age = time.time() - os.stat(scores_file).st_mtime if exists(scores_file) else FOLD_INTERVAL
+    if log_size >= FOLD_LOG_SIZE or scores_age >= FOLD_INTERVAL:
+        fold(half_life_days, log_file, scores_file)
+
+def fold(half_life_days, log_file=None, scores_file=None):
+    # several cmd processes (and threads of the scheduler) may fold at once, the lock file serializes them
+    (log_file, scores_file) = (log_file or LOG_FILE, scores_file or SCORES_FILE)
+    with open(scores_file + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        fold_locked(half_life_days, log_file, scores_file)
+
+def read_folded_logs(log_file) -> [str]:
+    # an append which opened the log before it was moved lands in the moved file after it was read,
+    # so the moved file is named by the length which was read and removed only by the next fold
+    lines = []
+    for folded_file in glob.glob(glob.escape(log_file) + '.folded-*'):
+        with open(folded_file, 'rb') as log:
+            log.seek(int(folded_file.rsplit('-', 1)[1]))
+            lines += log.read().decode('utf-8', 'replace').splitlines()
+        os.remove(folded_file)
+    folding_file = log_file + '.folding'
+    try:
+        os.replace(log_file, folding_file) # concurrent invocations append to a new log
+    except FileNotFoundError:
+        return lines
+    with open(folding_file, 'rb') as log:
+        content = log.read()
+    os.replace(folding_file, '{}.folded-{}'.format(log_file, len(content)))
+    return lines + content.decode('utf-8', 'replace').splitlines()
+
+def fold_locked(half_life_days, log_file, scores_file):
+    lines = read_folded_logs(log_file)
+    if not lines:
+        return
+    now = time.time()
+    half_life = half_life_days * DAY
+    scores = {}
+    for (key, (score, since)) in filemanip.load_json_file(scores_file).items():
+        scores[key] = decayed(score, since, now, half_life)
+    for line in lines:
+        (timestamp, _, key) = line.partition('\t')
+        if not key or not timestamp.isdigit(): continue
+        scores[key] = scores.get(key, 0) + min(1, decayed(1, int(timestamp), now, half_life))
+    # negligible scores are dropped to keep the file small, readers never see a partial file
+    filemanip.save_json_file({key: [round(score, 4), int(now)] for (key, score) in scores.items() if score >= 0.01}, scores_file + '.tmp')
+    os.replace(scores_file + '.tmp', scores_file)
+
+class Scores:
+    # loaded lazily by one read of the scores file, only when a ranking is needed
+    def __init__(self, half_life_days, scores_file=None):
+        self.half_life = half_life_days * DAY
+        self.scores_file = scores_file or SCORES_FILE
+        self._scores = None
+
+    @property
+    def scores(self) -> {str: float}:
+        if self._scores is None:
+            now = time.time()
+            self._scores = {key: decayed(score, since, now, self.half_life) for (key, (score, since)) in filemanip.load_json_file(self.scores_file).items()}
+        return self._scores
+
+    def of(self, command) -> float:
+        return self.scores.get(command_key(command), 0)
+
+    def of_aliases(self, commands) -> {str: float}:
+        res = {}
+        for command in commands:
+            if command.alias:
+                res[command.alias] = max(res.get(command.alias, 0), self.of(command))
+        return res
@@ -6,6 +6,7 @@ class Parser:
     def __init__(self, arguments, print_help):
         self.arguments = arguments
         self.print_help = print_help
+        self.result = None # returned by the function of the last matched argument
 
     def peek(self):
         if len(self.arguments) != 0:
@@ -36,7 +37,7 @@ class Parser:
                 for arg in args:
                     if current in [arg.arg_name, arg.short_arg_name]:
                         self.shift()
-                        arg.function()
+                        self.result = arg.function()
                         return True
         elif self.print_help:
             print_str(ArgumentGroup.to_str(groups), end='')
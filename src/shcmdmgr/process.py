@@ -1,6 +1,24 @@
 ''' Helping functions to handle sub-process creation '''
+import os
+import sys
+import json
+import time
+import signal
+import resource
+import threading
 import subprocess
 
+from shcmdmgr import config
+
+TERMINATE_GRACE_PERIOD = 3 # seconds between SIGTERM and SIGKILL
+TIMEOUT_EXIT_CODE = 124 # the same as the coreutils timeout
+SIZE_UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+RUNNING = set() # supervised processes, terminated when the user interrupts
+
+LOGGER = config.get_logger()
+
+
 def run_script(command_with_arguments, formatter):
     try:
         process = subprocess.Popen(command_with_arguments)
@@ -14,3 +32,158 @@ def run_script(command_with_arguments, formatter):
         formatter.print_str('could not be run, because the file is not executable')
     except KeyboardInterrupt:
         formatter.print_str()
+
+class InvalidLimit(ValueError):
+    pass
+
+def parse_size(size) -> int:
+    # number of bytes, either a number or a string with a K/M/G suffix, e.g. "512M"
+    if size is None or isinstance(size, (int, float)):
+        return None if size is None else int(size)
+    size = str(size).strip().upper()
+    if size[-1:] in SIZE_UNITS:
+        return int(float(size[:-1]) * SIZE_UNITS[size[-1]])
+    return int(size)
+
+LIMIT_TYPES = {'timeout': float, 'cpu_limit': int, 'memory_limit': parse_size, 'nice': int}
+LIMIT_EXAMPLES = {'timeout': '10', 'cpu_limit': '60', 'memory_limit': '"512M"', 'nice': '10'}
+
+def check_limits(limits) -> dict:
+    # the limits as written in the catalogue converted to numbers, InvalidLimit if a value is not understood
+    res = {}
+    for (name, value) in (limits or {}).items():
+        if value is None: continue
+        try:
+            res[name] = LIMIT_TYPES[name](value)
+        except (TypeError, ValueError):
+            res[name] = None
+        if res[name] is None or isinstance(value, bool) or (name != 'nice' and res[name] <= 0):
+            raise InvalidLimit('invalid {} {}, use e.g. {}'.format(name, json.dumps(value), LIMIT_EXAMPLES[name]))
+    return res
+
+def limit_resources(limits):
+    # None when nothing is to be limited, preexec_fn is not safe to use from threads (of the scheduler)
+    cpu_limit = limits.get('cpu_limit')
+    memory_limit = limits.get('memory_limit')
+    nice = limits.get('nice')
+    if not (cpu_limit or memory_limit or nice):
+        return None
+    def apply(): # runs in the child between fork and exec
+        os.setpgid(0, 0)
+        if nice: os.nice(nice)
+        if cpu_limit: resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 1)) # SIGXCPU, then SIGKILL
+        if memory_limit: resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    return apply
+
+def signal_group(process_group, signal_number) -> bool:
+    try:
+        os.killpg(process_group, signal_number)
+        return True
+    except ProcessLookupError:
+        return False
+
+def terminate_group(process):
+    # the whole group is terminated so that no grandchildren are left behind
+    deadline = time.monotonic() + TERMINATE_GRACE_PERIOD
+    signal_group(process.pid, signal.SIGTERM)
+    signal_group(process.pid, signal.SIGCONT) # stopped processes would not handle SIGTERM
+    try:
+        process.wait(TERMINATE_GRACE_PERIOD)
+    except subprocess.TimeoutExpired:
+        pass
+    while time.monotonic() < deadline and signal_group(process.pid, 0):
+        time.sleep(0.05)
+    signal_group(process.pid, signal.SIGKILL)
+    process.wait()
+
+def terminate_all():
+    for process in list(RUNNING):
+        terminate_group(process)
+
+def controlling_terminal():
+    # the terminal is handed over only from the main thread of a foreground process
+    if threading.current_thread() is not threading.main_thread():
+        return None
+    try:
+        terminal = sys.stdin.fileno()
+        if os.isatty(terminal) and os.tcgetpgrp(terminal) == os.getpgrp():
+            return terminal
+    except (OSError, ValueError):
+        pass
+    return None
+
+def set_foreground(terminal, process_group):
+    previous_handler = signal.signal(signal.SIGTTOU, signal.SIG_IGN) # a background process may not change it otherwise
+    try:
+        os.tcsetpgrp(terminal, process_group)
+    finally:
+        signal.signal(signal.SIGTTOU, previous_handler)
+
+def exit_status(status) -> int:
+    # the same as Popen.returncode, negative when killed by a signal
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def wait_foreground(process, terminal, timeout=None) -> int:
+    # like process.wait, but when the process is stopped (ctrl-z) we stop as well, so that the shell regains control
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        (pid, status) = os.waitpid(process.pid, os.WUNTRACED | (os.WNOHANG if deadline else 0))
+        if pid == 0:
+            if time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(process.args, timeout)
+            time.sleep(0.05)
+            continue
+        if os.WIFSTOPPED(status):
+            set_foreground(terminal, os.getpgrp())
+            os.kill(os.getpid(), signal.SIGTSTP) # continues here once the shell resumes us (fg)
+            set_foreground(terminal, process.pid)
+            signal_group(process.pid, signal.SIGCONT)
+            continue
+        process.returncode = exit_status(status) # Popen must not wait for it again
+        return process.returncode
+
+def start(argv, limits=None, **popen_args) -> subprocess.Popen:
+    # the process leads its own process group and is limited by cpu_limit, memory_limit, and nice (see check_limits)
+    if sys.version_info >= (3, 11):
+        popen_args['process_group'] = 0
+    process = subprocess.Popen(argv, preexec_fn=limit_resources(limits or {}), **popen_args)
+    try:
+        os.setpgid(process.pid, process.pid) # also in the parent, so that the group surely exists
+    except (PermissionError, ProcessLookupError):
+        pass # the child has already executed or exited
+    RUNNING.add(process)
+    return process
+
+def supervise(process, limits=None) -> int:
+    # waits for the process, on timeout or interrupt terminates its whole group
+    timeout = (limits or {}).get('timeout')
+    terminal = controlling_terminal()
+    try:
+        if terminal is not None:
+            set_foreground(terminal, process.pid)
+            signal_group(process.pid, signal.SIGCONT) # in case it tried to read before it became foreground
+        try:
+            if terminal is not None:
+                return_code = wait_foreground(process, terminal, timeout)
+            else:
+                return_code = process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            LOGGER.warning('the command did not finish in %s seconds, terminating it', str(timeout))
+            terminate_group(process)
+            return TIMEOUT_EXIT_CODE
+        except KeyboardInterrupt:
+            terminate_group(process)
+            raise
+        if return_code == -signal.SIGINT: # ctrl-c was delivered to the foreground group directly
+            terminate_group(process)
+            raise KeyboardInterrupt()
+        return return_code
+    finally:
+        if terminal is not None:
+            set_foreground(terminal, os.getpgrp())
+        RUNNING.discard(process)
+
+def run(argv, limits=None, **popen_args) -> int:
+    return supervise(start(argv, limits, **popen_args), limits)
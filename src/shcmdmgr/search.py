@@ -0,0 +1,176 @@
+'''
+Search over the command catalogue
+
+The query is a list of terms joined by AND (default), OR, and NOT, optionally
+grouped with parentheses. A term is a case-insensitive regex matched against
+the command and its description, or a field filter:
+alias:<regex>, des:<regex>, cmd:<regex>, scope:<global|project>,
+since:<date, e.g. 2020-05, or number of days, e.g. 7d>.
+Quoted terms are always searched for literally, even "OR".
+'''
+import re
+import datetime
+
+from shcmdmgr import config
+
+TEXT_FIELDS = {'alias': 'alias', 'des': 'description', 'cmd': 'command'}
+DEFAULT_FIELDS = ['command', 'description']
+DATE_FORMATS = ['%Y-%m-%d', '%Y-%m', '%Y']
+TOKEN_REGEX = re.compile(r'[^\s()"]+:"[^"]*"|"[^"]*"|\(|\)|[^\s()]+')
+OPERATORS = ['AND', 'OR', 'NOT', '(', ')']
+
+
+class Table:
+    # the catalogue stored by columns, each column is a list indexed by row
+    def __init__(self, scoped_commands, scores=None, time_format: str = None):
+        self.commands = [command for (_, command) in scoped_commands]
+        self.time_format = time_format or config.get_conf()['time_format'] # the format of creation_time
+        self._created = None
+        self.columns = {
+            'alias': [command.alias or '' for command in self.commands],
+            'command': [command.command if isinstance(command.command, str) else '' for command in self.commands],
+            'description': [command.description or '' for command in self.commands],
+            'creation_time': [command.creation_time or '' for command in self.commands],
+            'scope': [scope for (scope, _) in scoped_commands],
+            'frecency': [scores.of(command) if scores else 0 for command in self.commands],
+        }
+
+    def __len__(self):
+        return len(self.commands)
+
+    def created(self, row) -> datetime.datetime:
+        # the creation times are parsed only when a query filters by them
+        if self._created is None:
+            self._created = [parse_time(text, self.time_format) for text in self.columns['creation_time']]
+        return self._created[row]
+
+
+def parse_time(text, time_format) -> datetime.datetime:
+    try:
+        return datetime.datetime.strptime(text, time_format)
+    except ValueError:
+        return None
+
+
+class Query:
+    def __init__(self, query: str):
+        self.highlights = {} # column -> patterns which are shown in the results
+        self.tokens = TOKEN_REGEX.findall(query) # quotes are kept, so that a quoted "OR" is not an operator
+        self.position = 0
+        if self.tokens:
+            self.predicate = self._parse_or(False)
+            if self.position != len(self.tokens):
+                raise ValueError('unexpected ' + self.tokens[self.position])
+        else:
+            self.predicate = lambda table, row: 0
+
+    def search(self, table: Table) -> [(int, int)]:
+        # returns (score, row) of all matching rows, in one pass over the table
+        predicate = self.predicate
+        results = []
+        for row in range(len(table)):
+            score = predicate(table, row)
+            if score is not None:
+                results.append((score, row))
+        return results
+
+    def spans(self, table: Table, row: int, column: str) -> [(int, int)]:
+        text = table.columns[column][row]
+        return [match.span() for pattern in self.highlights.get(column, []) for match in pattern.finditer(text) if match.end() > match.start()]
+
+    def _peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def _shift(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError('unexpected end of the query')
+        self.position += 1
+        return token
+
+    def _parse_or(self, negated):
+        children = [self._parse_and(negated)]
+        while self._peek() == 'OR':
+            self._shift()
+            children.append(self._parse_and(negated))
+        if len(children) == 1:
+            return children[0]
+        def evaluate(table, row):
+            scores = [score for score in (child(table, row) for child in children) if score is not None]
+            return sum(scores) if scores else None
+        return evaluate
+
+    def _parse_and(self, negated):
+        children = [self._parse_not(negated)]
+        while self._peek() not in [None, 'OR', ')']:
+            if self._peek() == 'AND':
+                self._shift()
+            children.append(self._parse_not(negated))
+        if len(children) == 1:
+            return children[0]
+        def evaluate(table, row):
+            total = 0
+            for child in children:
+                score = child(table, row)
+                if score is None:
+                    return None
+                total += score
+            return total
+        return evaluate
+
+    def _parse_not(self, negated):
+        if self._peek() == 'NOT':
+            self._shift()
+            child = self._parse_not(not negated)
+            return lambda table, row: 0 if child(table, row) is None else None
+        return self._parse_atom(negated)
+
+    def _parse_atom(self, negated):
+        token = self._shift()
+        if token == '(':
+            child = self._parse_or(negated)
+            if self._shift() != ')':
+                raise ValueError('missing )')
+            return child
+        if token in OPERATORS:
+            raise ValueError('unexpected ' + token)
+        return self._parse_term(token, negated)
+
+    def _parse_term(self, token, negated):
+        (field, _, value) = token.partition(':')
+        if not value or field not in list(TEXT_FIELDS) + ['scope', 'since']:
+            (field, value) = (None, token)
+        value = value.strip('"')
+        if field == 'scope':
+            return lambda table, row: 0 if table.columns['scope'][row] == value else None
+        if field == 'since':
+            cutoff = Query._since_cutoff(value)
+            def evaluate_since(table, row):
+                created = table.created(row)
+                return 0 if created is not None and created >= cutoff else None
+            return evaluate_since
+        columns = [TEXT_FIELDS[field]] if field else DEFAULT_FIELDS
+        try:
+            pattern = re.compile(value, re.I)
+        except re.error as ex:
+            raise ValueError('invalid regex {}: {}'.format(value, ex))
+        if not negated:
+            for column in columns:
+                self.highlights.setdefault(column, []).append(pattern)
+        def evaluate(table, row):
+            score = sum(len(pattern.findall(table.columns[column][row])) for column in columns)
+            return score if score != 0 else None
+        return evaluate
+
+    @staticmethod
+    def _since_cutoff(value) -> datetime.datetime:
+        days = re.fullmatch(r'(\d+)d', value)
+        if days:
+            return datetime.datetime.now() - datetime.timedelta(days=int(days.group(1)))
+        for date_format in DATE_FORMATS:
+            cutoff = parse_time(value, date_format)
+            if cutoff is not None:
+                return cutoff
+        raise ValueError('invalid date ' + value + ', use e.g. 2020-05-01 or 7d')
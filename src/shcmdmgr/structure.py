@@ -1,11 +1,10 @@
 import os
 import datetime
 import shlex
-import subprocess
 from os.path import join, exists, dirname, basename
 from string import Template
 
-from shcmdmgr import config, filemanip, process
+from shcmdmgr import config, filemanip, process, frecency
 
 PROJECT_SPECIFIC_SUBFOLDER = ".cmd"
 
@@ -15,7 +14,9 @@ CONF = config.get_conf()
 
 class Command:
     # command can be either str, or a function (str[]) -> None
-    def __init__(self, command: any, description: str = None, alias: str = None, creation_time: str = None):
+    def __init__(self, command: any, description: str = None, alias: str = None, creation_time: str = None,
+                 depends: [str] = None, inputs: [str] = None, outputs: [str] = None, cache_ttl: int = None,
+                 timeout: float = None, cpu_limit: int = None, memory_limit: any = None, nice: int = None):
         self.command = command
         if description == '':
             description = None
@@ -26,44 +27,57 @@ class Command:
         if creation_time is None:
             creation_time = str(datetime.datetime.now().strftime(CONF['time_format']))
         self.creation_time = creation_time
+        self.depends = depends or None # aliases which are run before this command
+        self.inputs = inputs or None # files (globs) whose change causes the command to rerun
+        self.outputs = outputs or None # files which must exist for the command to be skipped
+        self.cache_ttl = cache_ttl # seconds for which the output may be replayed by --cached
+        self.timeout = timeout # wall clock seconds
+        self.cpu_limit = cpu_limit # cpu seconds
+        self.memory_limit = memory_limit # bytes, or a string such as "512M"
+        self.nice = nice
+        self._catalogue = None # file the command was loaded from, not saved
+
+    @property
+    def catalogue(self) -> str:
+        return self._catalogue
 
     @classmethod
-    def from_json(cls, data):
-        return cls(**data)
-
-    def find(self, query):
-        to_check = [
-            # {'name':'ali', 'field':self.alias},
-            {'name':'cmd', 'field':self.command},
-            {'name':'des', 'field':self.description},
-            # {'name':'ctm', 'field':self.creation_time},
-        ]
-        total_priority = 0
-        total_formatted_output = ""
-        for check in to_check:
-            (priority, formatted_output) = search_and_format(query, check['field'])
-            total_priority += priority
-            total_formatted_output += check['name'] + ': ' + formatted_output + '\n'
-        if total_priority != 0:
-            return (total_priority, total_formatted_output)
-        return None
+    def from_json(cls, data, catalogue=None):
+        command = cls(**data)
+        command._catalogue = catalogue
+        return command
+
+    def argv(self, args=None) -> [str]:
+        cmd_subs = Template(self.command).substitute(os.environ)
+        LOGGER.debug('command with substituted variables: %s', str(cmd_subs))
+        cmd_split = shlex.split(cmd_subs)
+        LOGGER.debug('command splitted into arguments: %s', str(cmd_split))
+        return cmd_split + (args or [])
 
-    def execute(self, args=None):
+    def execute(self, args=None, stdin=None):
         if not args:
             args = []
         if isinstance(self.command, str):
+            limits = process.check_limits(self.limits)
             LOGGER.verbose('running command: ' + self.command)
-            cmd_subs = Template(self.command).substitute(os.environ)
-            LOGGER.debug('command with substituted variables: %s', str(cmd_subs))
-            cmd_split = shlex.split(cmd_subs)
-            LOGGER.debug('command splitted into arguments: %s', str(cmd_split))
-            subprocess.run(cmd_split + args, check=False)
+            frecency.record(self)
+            return_code = process.run(self.argv(args), limits, stdin=stdin)
+            frecency.maybe_fold(CONF['frecency_half_life_days'])
+            return return_code
         else:
-            self.command(args)
+            return self.command(args)
+
+    @property
+    def limits(self) -> dict:
+        return {'timeout': self.timeout, 'cpu_limit': self.cpu_limit, 'memory_limit': self.memory_limit, 'nice': self.nice}
+
+    @property
+    def is_incremental(self) -> bool:
+        return bool(self.depends or self.inputs)
 
 def load_commands(commands_file_location) -> [Command]:
     commands_db = filemanip.load_json_file(commands_file_location)
-    return [Command.from_json(j) for j in commands_db]
+    return [Command.from_json(j, commands_file_location) for j in commands_db]
 
 
 class Project:
@@ -79,6 +93,7 @@ class Project:
         self.config_file = join(self.cmd_script_directory, 'config.json')
         # conf.update(filemanip.load_json_file(self.config_file))
         self.commands_file = join(self.cmd_script_directory, 'commands.json')
+        self.stamp_file = join(self.cmd_script_directory, 'stamps.json')
         self.completion_script = join(self.cmd_script_directory, 'completion.py')
         self.help_script = join(self.cmd_script_directory, 'help.py')
         if not exists(self.commands_file):
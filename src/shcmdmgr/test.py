@@ -1,12 +1,219 @@
+import os
+import time
+import tempfile
 import unittest
 
-from shcmdmgr import complete
+from shcmdmgr import complete, search, export, cache, process, frecency
+from shcmdmgr.structure import Command
+from shcmdmgr.dependency import Scheduler
 
 class TestMainInvocation(unittest.TestCase):
     def test_shell_invocation(self):
         com = complete.get_complete('last-arg')
         self.assertTrue(com)
 
+class TestSearch(unittest.TestCase):
+    def setUp(self):
+        self.table = search.Table([
+            ('global', Command('lsb_release -a', 'Shows the system version', 'sysversion', '2020-04-11 00:24:27')),
+            ('global', Command('do-release-upgrade', 'Upgrades the system', 'sysupgrade', '2020-04-11 00:25:08')),
+            ('project', Command('$project_root/.cmd/build.sh', 'Builds the project', 'build', '2020-05-05 18:54:24')),
+        ])
+
+    def rows(self, query):
+        return sorted(row for (_, row) in search.Query(query).search(self.table))
+
+    def test_terms(self):
+        self.assertEqual(self.rows('system'), [0, 1])
+        self.assertEqual(self.rows('system version'), [0])
+        self.assertEqual(self.rows('version OR build'), [0, 2])
+        self.assertEqual(self.rows('system NOT (upgrade OR nothing)'), [0])
+
+    def test_field_filters(self):
+        self.assertEqual(self.rows('alias:^sys'), [0, 1])
+        self.assertEqual(self.rows('scope:project'), [2])
+        self.assertEqual(self.rows('since:2020-05'), [2])
+        self.assertEqual(self.rows('des:"the system"'), [0, 1])
+
+    def test_quoted_operator_is_a_term(self):
+        self.table = search.Table([('global', Command('true', 'this OR that', 'either'))])
+        self.assertEqual(self.rows('"OR"'), [0])
+        self.assertEqual(self.rows('"NOT" OR this'), [0])
+
+    def test_since_uses_configured_time_format(self):
+        table = search.Table([('global', Command('true', None, 'a', '11.04.2020 00:24')), ('global', Command('true', None, 'b', '05.05.2020 18:54'))], None, '%d.%m.%Y %H:%M')
+        self.assertEqual([row for (_, row) in search.Query('since:2020-05').search(table)], [1])
+
+    def test_score_and_spans(self):
+        query = search.Query('s NOT build')
+        self.assertEqual(dict((row, score) for (score, row) in query.search(self.table))[0], 7)
+        self.assertEqual(query.spans(self.table, 1, 'description')[0], (7, 8))
+
+    def test_invalid_query(self):
+        with self.assertRaises(ValueError):
+            search.Query('(system')
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.frecency_files = (frecency.LOG_FILE, frecency.SCORES_FILE)
+        frecency.LOG_FILE = os.path.join(self.directory.name, 'invocations.log')
+        frecency.SCORES_FILE = os.path.join(self.directory.name, 'frecency.json')
+
+    def tearDown(self):
+        (frecency.LOG_FILE, frecency.SCORES_FILE) = self.frecency_files
+        self.directory.cleanup()
+
+    def test_collect_dependencies(self):
+        commands = [Command('true', None, 'lint'), Command('true', None, 'build', depends=['lint']), Command('true', None, 'deploy', depends=['build', 'lint'])]
+        graph = Scheduler(commands, None, '.').collect(commands[2])
+        self.assertEqual(list(graph), ['lint', 'build', 'deploy'])
+
+    def test_collect_detects_cycle(self):
+        commands = [Command('true', None, 'a', depends=['b']), Command('true', None, 'b', depends=['a'])]
+        with self.assertRaises(Exception):
+            Scheduler(commands, None, '.').collect(commands[0])
+
+    def test_up_to_date_commands_are_skipped(self):
+        path = lambda name: os.path.join(self.directory.name, name)
+        step = lambda alias, source, target: 'sh -c "echo {} >> {}; cp {} {}"'.format(alias, path('runs'), path(source), path(target))
+        commands = [
+            Command('true', None, 'lint'),
+            Command(step('build', 'src', 'out'), None, 'build', depends=['lint'], inputs=['src'], outputs=['out']),
+            Command(step('package', 'out', 'pkg'), None, 'package', depends=['build', 'lint'], inputs=['pkg.conf'], outputs=['pkg']),
+        ]
+        scheduler = Scheduler(commands, path('stamps.json'), self.directory.name)
+        for (name, content) in [('src', 'a'), ('pkg.conf', '')]:
+            with open(path(name), 'w') as source: source.write(content)
+        for _ in range(2):
+            self.assertEqual(scheduler.run(commands[2]), 0)
+        with open(path('src'), 'w') as source: source.write('changed')
+        self.assertEqual(scheduler.run(commands[2]), 0)
+        with open(path('runs')) as runs:
+            self.assertEqual(runs.read().split(), ['build', 'package', 'build', 'package'])
+
+class TestShellExport(unittest.TestCase):
+    def test_generate(self):
+        global_commands = [Command('lsb_release -a', None, 'sysversion'), Command('true', None, 'deploy', depends=['sysversion']), Command('sleep 30', None, 'wait', timeout=1), Command('$TOOL x', None, 'tool')]
+        build = Command('$project_root/.cmd/build.sh', None, 'build-all')
+        build._catalogue = '/home/user/project/.cmd/commands.json'
+        projects = {'/home/user/project': [build]}
+        generated = export.generate('bash', global_commands, projects)
+        self.assertIn('_shcmdmgr_g_sysversion() {\n    lsb_release -a "$@"\n}', generated)
+        self.assertIn('_shcmdmgr_p0_build_all() {\n    /home/user/project/.cmd/build.sh "$@"\n}', generated)
+        self.assertIn('build-all) _shcmdmgr_fn=_shcmdmgr_p0_build_all _shcmdmgr_catalogue=/home/user/project/.cmd/commands.json;;', generated)
+        self.assertIn("printf '%(%s)T", generated)
+        self.assertIn('$EPOCHSECONDS', export.generate('zsh', global_commands, projects))
+        self.assertIn('/home/user/project)', generated)
+        self.assertNotIn('_shcmdmgr_g_deploy', generated)
+        self.assertIn('deploy) command cmd "$@"; return;;', generated)
+        self.assertIn('wait) command cmd "$@"; return;;', generated)
+        self.assertIn('tool) command cmd "$@"; return;;', generated)
+
+    def test_shell_command_matches_python_argv(self):
+        self.assertEqual(export.shell_command('echo a | tr a b', {}), "echo a '|' tr a b")
+        self.assertEqual(export.shell_command('echo $$HOME "${project_root}/a b"', {'project_root': '/p'}), "echo '$HOME' '/p/a b'")
+        self.assertEqual(export.shell_command('$project_root/run.sh', {'project_root': '/my project'}), "/my project/run.sh")
+        # a value of other variables is known only when running, and it is split by python
+        self.assertIsNone(export.shell_command('$TOOL x', {'project_root': '/p'}))
+        self.assertIsNone(export.shell_command('echo "unclosed', {}))
+
+class TestOutputCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = cache.OutputCache(400, [], self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store_and_load(self):
+        key = self.cache.key(['echo', 'a'], '/')
+        self.assertNotEqual(key, self.cache.key(['echo', 'b'], '/'))
+        self.cache.store(key, 3, b'out', b'err')
+        self.assertEqual(self.cache.load(key, 60), (3, b'out', b'err'))
+        self.assertIsNone(self.cache.load(key, -1))
+
+    def test_least_recently_used_are_evicted(self):
+        for index in range(5):
+            self.cache.store(str(index), 0, 40 * b'x', b'')
+            os.utime(os.path.join(self.directory.name, str(index)), (index, index))
+        self.cache.store('last', 0, 40 * b'x', b'')
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['3', '4', 'last'])
+
+    def test_killed_runs_are_not_stored(self):
+        self.assertEqual(self.cache.run(Command('sleep 5', cache_ttl=60, timeout=0.2)), process.TIMEOUT_EXIT_CODE)
+        self.assertEqual(self.cache.run(Command('sh -c "kill $$$$"', cache_ttl=60)), -15)
+        self.assertEqual(os.listdir(self.directory.name), [])
+        self.assertEqual(self.cache.run(Command('sh -c "exit 1"', cache_ttl=60)), 1)
+        self.assertEqual(len(os.listdir(self.directory.name)), 1)
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.frecency_files = (frecency.LOG_FILE, frecency.SCORES_FILE)
+        frecency.LOG_FILE = os.path.join(self.directory.name, 'invocations.log')
+        frecency.SCORES_FILE = os.path.join(self.directory.name, 'frecency.json')
+
+    def tearDown(self):
+        (frecency.LOG_FILE, frecency.SCORES_FILE) = self.frecency_files
+        self.directory.cleanup()
+
+    def test_parse_size(self):
+        self.assertEqual(process.parse_size('512M'), 512 << 20)
+        self.assertEqual(process.parse_size('1.5k'), 1536)
+        self.assertEqual(process.parse_size(1000), 1000)
+
+    def test_check_limits(self):
+        self.assertEqual(process.check_limits({'timeout': '10', 'memory_limit': '1k', 'nice': None}), {'timeout': 10.0, 'memory_limit': 1024})
+        for limits in [{'memory_limit': 'lots'}, {'timeout': -1}, {'cpu_limit': '1.5'}]:
+            with self.assertRaises(process.InvalidLimit):
+                process.check_limits(limits)
+        with self.assertRaises(process.InvalidLimit):
+            Command('true', memory_limit='lots').execute()
+        self.assertFalse(os.path.exists(frecency.LOG_FILE)) # not recorded as it did not run
+
+    def test_timeout_terminates_command(self):
+        self.assertEqual(Command('sleep 10', timeout=0.2).execute(), process.TIMEOUT_EXIT_CODE)
+        self.assertEqual(Command('sh -c "exit 3"', nice=1).execute(), 3)
+
+class TestFrecency(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.directory.name, 'invocations.log')
+        self.scores_file = os.path.join(self.directory.name, 'frecency.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_fold_and_rank(self):
+        often = Command.from_json({'command': 'make', 'alias': 'build'}, 'commands.json')
+        rarely = Command.from_json({'command': 'make test', 'alias': 'test'}, 'commands.json')
+        for _ in range(3): frecency.record(often, self.log_file)
+        frecency.record(rarely, self.log_file)
+        frecency.fold(14, self.log_file, self.scores_file)
+        self.assertFalse(os.path.exists(self.log_file))
+        scores = frecency.Scores(14, self.scores_file)
+        self.assertAlmostEqual(scores.of(often), 3, places=2)
+        self.assertEqual(scores.of(Command('make', None, 'build')), 0) # other catalogue
+        ranking = scores.of_aliases([often, rarely])
+        complete_words = complete.Complete('')
+        complete_words.words = ['test', 'build', 'lint']
+        complete_words.ranking = ranking
+        self.assertEqual(complete_words.words, ['build', 'test', 'lint'])
+
+    def test_late_appends_are_folded_later(self):
+        command = Command.from_json({'command': 'make', 'alias': 'build'}, 'commands.json')
+        frecency.record(command, self.log_file)
+        with open(self.log_file, 'a') as late: # opened before the log is moved by the fold
+            frecency.fold(14, self.log_file, self.scores_file)
+            late.write('{}\t{}\n'.format(int(time.time()), frecency.command_key(command)))
+        frecency.record(command, self.log_file)
+        frecency.fold(14, self.log_file, self.scores_file)
+        self.assertAlmostEqual(frecency.Scores(14, self.scores_file).of(command), 3, places=2)
+
+    def test_decay(self):
+        self.assertAlmostEqual(frecency.decayed(4, 0, 2 * frecency.DAY, frecency.DAY), 1)
+
 if __name__ == '__main__':
     unittest.main()
 